@@ -15,13 +15,30 @@
 # limitations under the License.
 #
 
-import datetime
+import collections
+import concurrent.futures
+import itertools
+import json
 import logging
+import os
+import random
+import threading
 import time
 import re
-from typing import Any, Dict, List, Optional, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    MutableMapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 from google.auth import credentials as auth_credentials
+from google.cloud import storage
 from google.cloud.aiplatform import base
 from google.cloud.aiplatform import initializer
 from google.cloud.aiplatform import utils
@@ -34,6 +51,7 @@ from google.cloud.aiplatform.metadata import utils as metadata_utils
 from google.cloud.aiplatform.utils import yaml_utils
 from google.cloud.aiplatform.utils import pipeline_utils
 from google.protobuf import json_format
+from google.protobuf import struct_pb2
 
 from google.cloud.aiplatform.compat.types import (
     pipeline_job as gca_pipeline_job,
@@ -42,46 +60,429 @@ from google.cloud.aiplatform.compat.types import (
 
 _LOGGER = base.Logger(__name__)
 
-_PIPELINE_COMPLETE_STATES = set(
-    [
-        gca_pipeline_state.PipelineState.PIPELINE_STATE_SUCCEEDED,
-        gca_pipeline_state.PipelineState.PIPELINE_STATE_FAILED,
-        gca_pipeline_state.PipelineState.PIPELINE_STATE_CANCELLED,
-        gca_pipeline_state.PipelineState.PIPELINE_STATE_PAUSED,
-    ]
+# States are stored as raw ints so that lookups avoid the enum wrappers.
+_PIPELINE_COMPLETE_STATES = frozenset(
+    {
+        int(gca_pipeline_state.PipelineState.PIPELINE_STATE_SUCCEEDED),
+        int(gca_pipeline_state.PipelineState.PIPELINE_STATE_FAILED),
+        int(gca_pipeline_state.PipelineState.PIPELINE_STATE_CANCELLED),
+        int(gca_pipeline_state.PipelineState.PIPELINE_STATE_PAUSED),
+    }
 )
 
-_PIPELINE_ERROR_STATES = set([gca_pipeline_state.PipelineState.PIPELINE_STATE_FAILED])
+_PIPELINE_ERROR_STATES = frozenset(
+    {int(gca_pipeline_state.PipelineState.PIPELINE_STATE_FAILED)}
+)
 
 # Pattern for valid names used as a Vertex resource name.
 _VALID_NAME_PATTERN = re.compile("^[a-z][-a-z0-9]{0,127}$")
 
+# Pattern for characters that are replaced when deriving a job ID from a
+# pipeline name.
+_INVALID_JOB_ID_CHARS = re.compile("[^-0-9a-z]+")
+
 # Pattern for an Artifact Registry URL.
-_VALID_AR_URL = re.compile(r"^https:\/\/([\w-]+)-kfp\.pkg\.dev\/.*")
+_VALID_AR_URL = re.compile(r"^https:\/\/([\w-]+)-kfp\.pkg\.dev\/.*", re.ASCII)
+
+# Number of bytes read from the start of a template to find the pipeline name.
+_PIPELINE_NAME_PEEK_SIZE = 4096
+
+# Patterns for the pipeline name of a PipelineSpec YAML or JSON document. The
+# KFP compiler starts YAML documents with a comment header naming the pipeline.
+_KFP_HEADER_PIPELINE_NAME_PATTERN = re.compile(
+    rb"\A# PIPELINE DEFINITION\r?\n# Name:[ \t]*([-\w.]+)[ \t]*\r?\n"
+)
+_YAML_PIPELINE_NAME_PATTERN = re.compile(
+    rb"^pipelineInfo:[ \t]*\r?\n[ \t]+name:[ \t]*([\"']?)([-\w.]+)\1[ \t]*\r?\n",
+    re.MULTILINE,
+)
+_JSON_PIPELINE_NAME_PATTERN = re.compile(
+    rb'"pipelineInfo"\s*:\s*\{\s*"name"\s*:\s*"((?:[^"\\]|\\.)*)"'
+)
+
+# _block_until_complete wait times
+_JOB_WAIT_TIME = 0.5  # start at half a second
+_MAX_JOB_WAIT_TIME = 5  # poll at least every five seconds
+_JOB_WAIT_TIME_MULTIPLIER = 1.5  # scale wait by 1.5 every iteration
+_JOB_WAIT_TIME_JITTER = 0.2  # randomize each wait by up to 20%
+_LOG_WAIT_TIME = 5
+_MAX_LOG_WAIT_TIME = 60 * 5  # 5 minute wait
+_LOG_WAIT_TIME_MULTIPLIER = 2  # scale log wait by 2 every log
+
+# Parsed pipeline templates serialized as JSON, keyed by template path,
+# content version, project and credentials. See _load_pipeline_spec.
+_PIPELINE_SPEC_CACHE_SIZE = 32
+_PIPELINE_SPEC_CACHE: "collections.OrderedDict[Tuple, str]" = collections.OrderedDict()
+_PIPELINE_SPEC_CACHE_LOCK = threading.Lock()
+
+# Time in seconds during which a synced PipelineJob is considered fresh.
+_SYNC_TTL = 0.2
+
+# Mapping from JSON names of the legacy runtime parameter Value fields to the
+# proto field names.
+_LEGACY_VALUE_FIELDS = {
+    "intValue": "int_value",
+    "doubleValue": "double_value",
+    "stringValue": "string_value",
+}
+
+
+def _get_current_time() -> time.struct_time:
+    """Gets the current local time."""
+    return time.localtime()
+
+
+def _is_ar_url(path: str) -> bool:
+    """Returns True if the path is an Artifact Registry URL.
+
+    The prefix check skips the regex for local paths and GCS URIs.
+    """
+    return path.startswith("https://") and _VALID_AR_URL.match(path) is not None
+
+
+def _peek_pipeline_name(template_prefix: bytes) -> Optional[str]:
+    """Finds the pipeline name in the beginning of a pipeline template.
+
+    Args:
+        template_prefix (bytes):
+            Required. The first bytes of a PipelineSpec JSON or YAML file.
+
+    Returns:
+        The pipeline name, or None if it is not found in the prefix.
+    """
+    match = _KFP_HEADER_PIPELINE_NAME_PATTERN.match(template_prefix)
+    if match:
+        return match.group(1).decode("utf-8")
+
+    match = _JSON_PIPELINE_NAME_PATTERN.search(template_prefix)
+    if match:
+        try:
+            return json.loads(b'"' + match.group(1) + b'"')
+        except ValueError:
+            # The pattern allows escapes that are invalid JSON, which is left
+            # to the full parse to report.
+            return None
+
+    match = _YAML_PIPELINE_NAME_PATTERN.search(template_prefix)
+    if match:
+        return match.group(2).decode("utf-8")
+
+    return None
+
+
+def _peek_ar_template(
+    template_path: str,
+    credentials: Optional[auth_credentials.Credentials] = None,
+) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """Finds the pipeline name of an Artifact Registry template by only
+    downloading the beginning of it.
+
+    If the name is not found there, which is common for JSON templates since
+    KFP sorts their keys, the rest of the template is read from the same
+    response and parsed.
+
+    Args:
+        template_path (str):
+            Required. The Artifact Registry URI of the template.
+        credentials (auth_credentials.Credentials):
+            Optional. Credentials to use with Artifact Registry.
+
+    Returns:
+        A tuple of the pipeline name and None if the name is found in the
+        beginning of the template, otherwise a tuple of None and the parsed
+        template.
+    """
+    response = yaml_utils._open_ar_uri(template_path, credentials)
+    try:
+        template_prefix = response.read(_PIPELINE_NAME_PEEK_SIZE)
+        pipeline_name = _peek_pipeline_name(template_prefix)
+        if pipeline_name:
+            return pipeline_name, None
+        template = template_prefix + response.read()
+    finally:
+        response.close()
+    return None, yaml_utils._load_yaml_or_json(template.decode("utf-8"))
+
+
+def _generate_job_id(pipeline_name: str, prefix: str = "") -> str:
+    """Generates a job ID from the pipeline name and the current timestamp.
+
+    Args:
+        pipeline_name (str):
+            Required. The name of the pipeline.
+        prefix (str):
+            Optional. The prefix of the job ID.
+
+    Returns:
+        The generated job ID.
+    """
+    return "{prefix}{pipeline_name}-{timestamp}".format(
+        prefix=prefix,
+        pipeline_name=_INVALID_JOB_ID_CHARS.sub("-", pipeline_name.lower()).strip("-"),
+        timestamp=time.strftime("%Y%m%d%H%M%S", _get_current_time()),
+    )
+
+
+def _get_cached_pipeline_spec(
+    cache_key: Tuple, load_template: Callable[[], Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Gets a pipeline template from the cache, loading it on a miss.
 
+    Templates are cached serialized as JSON so that every caller gets its own
+    copy to mutate, and json.loads is cheaper than copy.deepcopy.
 
-def _get_current_time() -> datetime.datetime:
-    """Gets the current timestamp."""
-    return datetime.datetime.now()
+    Args:
+        cache_key (Tuple):
+            Required. The key identifying the template and its content version.
+        load_template (Callable[[], Dict[str, Any]]):
+            Required. Loads the template on a cache miss.
+
+    Returns:
+        A Dict object representing the template.
+    """
+    with _PIPELINE_SPEC_CACHE_LOCK:
+        pipeline_spec_json = _PIPELINE_SPEC_CACHE.get(cache_key)
+        if pipeline_spec_json is not None:
+            _PIPELINE_SPEC_CACHE.move_to_end(cache_key)
+            return json.loads(pipeline_spec_json)
+
+    # The template is loaded outside of the lock, since it can be slow.
+    pipeline_spec = load_template()
+    with _PIPELINE_SPEC_CACHE_LOCK:
+        _PIPELINE_SPEC_CACHE[cache_key] = json.dumps(pipeline_spec)
+        if len(_PIPELINE_SPEC_CACHE) > _PIPELINE_SPEC_CACHE_SIZE:
+            _PIPELINE_SPEC_CACHE.popitem(last=False)
+    return pipeline_spec
+
+
+def _load_pipeline_spec(
+    template_path: str,
+    project: Optional[str] = None,
+    credentials: Optional[auth_credentials.Credentials] = None,
+) -> Dict[str, Any]:
+    """Loads a PipelineJob or PipelineSpec JSON or YAML file.
+
+    Templates are only downloaded and parsed again when their content changes,
+    so that creating many jobs from the same template is cheap. The content
+    version is the (mtime_ns, size) of a local file or the generation of a
+    Google Cloud Storage object. Artifact Registry templates are not cached,
+    since their tags can be moved.
+
+    Args:
+        template_path (str):
+            Required. The path of PipelineJob or PipelineSpec JSON or YAML file.
+        project (str):
+            Optional. Project to initiate the Storage client with.
+        credentials (auth_credentials.Credentials):
+            Optional. Credentials to use with Storage Client.
+
+    Returns:
+        A Dict object representing the template.
+    """
+    if template_path.startswith("gs://"):
+        storage_client = storage.Client(project=project, credentials=credentials)
+        blob = storage.Blob.from_string(template_path, storage_client)
+        blob.reload()
+        generation = blob.generation
+        if generation is None:
+            return yaml_utils._load_yaml_or_json(blob.download_as_bytes())
+        template_version = (generation,)
+
+        def load_template() -> Dict[str, Any]:
+            # Downloads the generation the cache key was built from.
+            return yaml_utils._load_yaml_or_json(
+                blob.download_as_bytes(if_generation_match=generation)
+            )
+
+    elif _is_ar_url(template_path):
+        return yaml_utils.load_yaml(template_path, project, credentials)
+    else:
+        stat = os.stat(template_path)
+        template_version = (stat.st_mtime_ns, stat.st_size)
+
+        def load_template() -> Dict[str, Any]:
+            return yaml_utils.load_yaml(template_path)
+
+    return _get_cached_pipeline_spec(
+        (template_path, template_version, project, credentials), load_template
+    )
+
+
+def _update_value_map(value_map: MutableMapping, values: Dict[str, Any]) -> None:
+    """Sets the entries of a protobuf map of Values from a dictionary.
+
+    The Values are populated in place, which is faster than converting the
+    dictionary with json_format.
+
+    Args:
+        value_map (MutableMapping):
+            Required. The protobuf map field from names to Value messages.
+        values (Dict[str, Any]):
+            Required. The mapping from names to JSON compatible values.
+
+    Raises:
+        TypeError: If a nested dictionary has keys that are not strings.
+        ValueError: If a value is not JSON compatible.
+    """
+    for name, value in values.items():
+        # bool is checked before numbers since it is a subclass of int.
+        if isinstance(value, str):
+            value_map[name].string_value = value
+        elif isinstance(value, bool):
+            value_map[name].bool_value = value
+        elif isinstance(value, (int, float)):
+            value_map[name].number_value = value
+        elif isinstance(value, list):
+            value_map[name].list_value.extend(value)
+        elif isinstance(value, dict):
+            value_map[name].struct_value.update(value)
+        else:
+            raise ValueError(f"Unexpected type {type(value)} of value {name}.")
+
+
+def _build_runtime_config(
+    runtime_config_dict: Dict[str, Any]
+) -> gca_pipeline_job.PipelineJob.RuntimeConfig:
+    """Builds a RuntimeConfig proto message.
+
+    Known fields are assigned directly rather than through json_format, which
+    walks the proto descriptors reflectively. Any other field is parsed with
+    json_format.ParseDict.
+
+    Args:
+        runtime_config_dict (Dict[str, Any]):
+            Required. The RuntimeConfig JSON spec built by
+            PipelineRuntimeConfigBuilder.
+
+    Returns:
+        A RuntimeConfig protobuf message.
+    """
+    runtime_config = gca_pipeline_job.PipelineJob.RuntimeConfig()
+    runtime_config_pb = runtime_config._pb
+    runtime_config_dict = dict(runtime_config_dict)
+
+    gcs_output_directory = runtime_config_dict.pop("gcsOutputDirectory", None)
+    if gcs_output_directory:
+        runtime_config_pb.gcs_output_directory = gcs_output_directory
+
+    for name, value in runtime_config_dict.pop("parameters", {}).items():
+        parameter = runtime_config_pb.parameters[name]
+        for key, field_value in value.items():
+            try:
+                setattr(parameter, _LEGACY_VALUE_FIELDS[key], field_value)
+            except (KeyError, TypeError, ValueError):
+                json_format.ParseDict({key: field_value}, parameter)
+
+    parameter_values = runtime_config_dict.pop("parameterValues", None)
+    if parameter_values:
+        try:
+            _update_value_map(runtime_config_pb.parameter_values, parameter_values)
+        except (TypeError, ValueError):
+            # Leaves the error reporting to json_format.
+            runtime_config_pb.ClearField("parameter_values")
+            runtime_config_dict["parameterValues"] = parameter_values
+
+    json_format.ParseDict(runtime_config_dict, runtime_config_pb)
+    return runtime_config
+
+
+def _build_runtime_config_from_job_spec(
+    pipeline_job: Dict[str, Any],
+    pipeline_root: Optional[str],
+    parameter_values: Optional[Dict[str, Any]],
+) -> gca_pipeline_job.PipelineJob.RuntimeConfig:
+    """Builds the RuntimeConfig of a PipelineJob spec.
+
+    Args:
+        pipeline_job (Dict[str, Any]):
+            Required. The PipelineJob JSON spec. Only the pipeline root input
+            definitions, the schema version and the runtime config are read.
+        pipeline_root (str):
+            Optional. The root of the pipeline outputs.
+        parameter_values (Dict[str, Any]):
+            Optional. The mapping from runtime parameter names to its values.
+
+    Returns:
+        A RuntimeConfig protobuf message.
+    """
+    builder = pipeline_utils.PipelineRuntimeConfigBuilder.from_job_spec_json(
+        pipeline_job
+    )
+    builder.update_pipeline_root(pipeline_root)
+    builder.update_runtime_parameters(parameter_values)
+    return _build_runtime_config(builder.build())
+
+
+def _build_template_runtime_config(
+    pipeline_root: str, parameter_values: Optional[Dict[str, Any]]
+) -> gca_pipeline_job.PipelineJob.RuntimeConfig:
+    """Builds the RuntimeConfig of a job whose spec the service resolves from
+    an Artifact Registry template.
+
+    Only KFP v2 pipelines, which use parameterValues, can be uploaded to
+    Artifact Registry.
+
+    Args:
+        pipeline_root (str):
+            Required. The root of the pipeline outputs.
+        parameter_values (Dict[str, Any]):
+            Optional. The mapping from runtime parameter names to its values.
+            Parameters set to None are left out.
+
+    Returns:
+        A RuntimeConfig protobuf message.
+    """
+    return _build_runtime_config(
+        {
+            "gcsOutputDirectory": pipeline_root,
+            "parameterValues": {
+                k: v for k, v in (parameter_values or {}).items() if v is not None
+            },
+        }
+    )
+
+
+def _dict_to_struct(value: Dict[str, Any]) -> struct_pb2.Struct:
+    """Converts a dictionary to a protobuf Struct.
+
+    Struct.update is several times faster than the generic conversion proto-plus
+    applies to dictionaries assigned to Struct fields.
+
+    Args:
+        value (Dict[str, Any]):
+            Required. The JSON compatible dictionary to convert.
+
+    Returns:
+        A protobuf Struct with the content of the dictionary.
+    """
+    struct = struct_pb2.Struct()
+    struct.update(value)
+    return struct
 
 
 def _set_enable_caching_value(
-    pipeline_spec: Dict[str, Any], enable_caching: bool
+    pipeline_spec: Union[Dict[str, Any], struct_pb2.Struct], enable_caching: bool
 ) -> None:
     """Sets pipeline tasks caching options.
 
     Args:
-     pipeline_spec (Dict[str, Any]):
-          Required. The dictionary of pipeline spec.
+     pipeline_spec (Union[Dict[str, Any], struct_pb2.Struct]):
+          Required. The dictionary or protobuf Struct of pipeline spec.
      enable_caching (bool):
           Required. Whether to enable caching.
     """
-    for component in [pipeline_spec["root"]] + list(
-        pipeline_spec["components"].values()
+    # The options are shared across tasks since they are copied when the spec
+    # is converted to, or assigned into, a proto Struct.
+    caching_options = {"enableCache": enable_caching}
+    for component in itertools.chain(
+        (pipeline_spec["root"],), pipeline_spec["components"].values()
     ):
-        if "dag" in component:
-            for task in component["dag"]["tasks"].values():
-                task["cachingOptions"] = {"enableCache": enable_caching}
+        # Components without a dag are skipped with a membership check rather
+        # than .get, which protobuf Struct does not have.
+        if "dag" not in component:
+            continue
+        for task in component["dag"]["tasks"].values():
+            task["cachingOptions"] = caching_options
 
 
 class PipelineJob(
@@ -105,6 +506,15 @@ class PipelineJob(
     # Required by the done() method
     _valid_done_states = _PIPELINE_COMPLETE_STATES
 
+    # Monotonic time of the last sync, see _sync_gca_resource_cached.
+    _last_sync_time = 0.0
+
+    # The dashboard uri does not change once the resource is created.
+    _cached_dashboard_uri = None
+
+    # Whether the pipeline was compiled with TFX, set when the spec is loaded.
+    _is_tfx = False
+
     def __init__(
         self,
         # TODO(b/223262536): Make the display_name parameter optional in the next major release
@@ -131,6 +541,9 @@ class PipelineJob(
                 can be a local path, a Google Cloud Storage URI (e.g. "gs://project.name"),
                 or an Artifact Registry URI (e.g.
                 "https://us-central1-kfp.pkg.dev/proj/repo/pack/latest").
+                Artifact Registry templates are not downloaded when job_id and
+                pipeline_root are set and enable_caching is not, the service
+                resolves them instead.
             job_id (str):
                 Optional. The unique ID of the job run.
                 If not specified, pipeline name + timestamp will be used.
@@ -186,51 +599,107 @@ class PipelineJob(
 
         super().__init__(project=project, location=location, credentials=credentials)
 
-        self._parent = initializer.global_config.common_location_path(
-            project=project, location=location
-        )
+        is_ar_template = _is_ar_url(template_path)
 
-        # this loads both .yaml and .json files because YAML is a superset of JSON
-        pipeline_json = yaml_utils.load_yaml(
-            template_path, self.project, self.credentials
-        )
+        # The service resolves Artifact Registry templates from template_uri,
+        # so they are only loaded when the spec is needed to generate the job
+        # ID, find the pipeline root or set the caching options.
+        defer_template = is_ar_template and pipeline_root and enable_caching is None
+        pipeline_json = None
+        if defer_template and not job_id:
+            pipeline_name, pipeline_json = _peek_ar_template(
+                template_path, self.credentials
+            )
+            if pipeline_name:
+                job_id = _generate_job_id(pipeline_name)
 
-        # Pipeline_json can be either PipelineJob or PipelineSpec.
-        if pipeline_json.get("pipelineSpec") is not None:
-            pipeline_job = pipeline_json
-            pipeline_root = (
-                pipeline_root
-                or pipeline_job["pipelineSpec"].get("defaultPipelineRoot")
-                or pipeline_job["runtimeConfig"].get("gcsOutputDirectory")
-                or initializer.global_config.staging_bucket
+        if defer_template and job_id:
+            pipeline_spec = None
+            runtime_config = _build_template_runtime_config(
+                pipeline_root, parameter_values
             )
         else:
-            pipeline_job = {
-                "pipelineSpec": pipeline_json,
-                "runtimeConfig": {},
-            }
-            pipeline_root = (
-                pipeline_root
-                or pipeline_job["pipelineSpec"].get("defaultPipelineRoot")
-                or initializer.global_config.staging_bucket
+            if pipeline_json is None:
+                # this loads both .yaml and .json files because YAML is a superset of JSON
+                pipeline_json = _load_pipeline_spec(
+                    template_path, self.project, self.credentials
+                )
+
+            # Pipeline_json can be either PipelineJob or PipelineSpec.
+            if pipeline_json.get("pipelineSpec") is not None:
+                pipeline_job = pipeline_json
+                pipeline_root = (
+                    pipeline_root
+                    or pipeline_job["pipelineSpec"].get("defaultPipelineRoot")
+                    or pipeline_job["runtimeConfig"].get("gcsOutputDirectory")
+                    or initializer.global_config.staging_bucket
+                )
+            else:
+                pipeline_job = {
+                    "pipelineSpec": pipeline_json,
+                    "runtimeConfig": {},
+                }
+                pipeline_root = (
+                    pipeline_root
+                    or pipeline_job["pipelineSpec"].get("defaultPipelineRoot")
+                    or initializer.global_config.staging_bucket
+                )
+            runtime_config = _build_runtime_config_from_job_spec(
+                pipeline_job, pipeline_root, parameter_values
             )
-        builder = pipeline_utils.PipelineRuntimeConfigBuilder.from_job_spec_json(
-            pipeline_job
+
+            pipeline_spec = pipeline_job["pipelineSpec"]
+            if not job_id:
+                job_id = _generate_job_id(pipeline_spec["pipelineInfo"]["name"])
+
+        pipeline_job_args = {}
+        if is_ar_template:
+            pipeline_job_args["template_uri"] = template_path
+
+        self._finalize_pipeline_job(
+            job_id=job_id,
+            pipeline_spec=pipeline_spec,
+            enable_caching=enable_caching,
+            display_name=display_name,
+            labels=labels,
+            runtime_config=runtime_config,
+            encryption_spec=initializer.global_config.get_encryption_spec(
+                encryption_spec_key_name=encryption_spec_key_name
+            ),
+            **pipeline_job_args,
         )
-        builder.update_pipeline_root(pipeline_root)
-        builder.update_runtime_parameters(parameter_values)
-        runtime_config_dict = builder.build()
-
-        runtime_config = gca_pipeline_job.PipelineJob.RuntimeConfig()._pb
-        json_format.ParseDict(runtime_config_dict, runtime_config)
-
-        pipeline_name = pipeline_job["pipelineSpec"]["pipelineInfo"]["name"]
-        self.job_id = job_id or "{pipeline_name}-{timestamp}".format(
-            pipeline_name=re.sub("[^-0-9a-z]+", "-", pipeline_name.lower())
-            .lstrip("-")
-            .rstrip("-"),
-            timestamp=_get_current_time().strftime("%Y%m%d%H%M%S"),
+
+    def _finalize_pipeline_job(
+        self,
+        job_id: str,
+        pipeline_spec: Optional[Union[Dict[str, Any], struct_pb2.Struct]],
+        enable_caching: Optional[bool],
+        **pipeline_job_args,
+    ) -> None:
+        """Validates the job ID and creates the PipelineJob proto message.
+
+        Shared by __init__ and clone once the pipeline spec and runtime config
+        are resolved.
+
+        Args:
+            job_id (str):
+                Required. The unique ID of the job run.
+            pipeline_spec (Union[Dict[str, Any], struct_pb2.Struct]):
+                Optional. The pipeline spec. Not set when the service resolves
+                the spec from the template URI.
+            enable_caching (bool):
+                Optional. Whether to turn on caching for the run.
+            **pipeline_job_args:
+                The other fields of the PipelineJob proto message.
+
+        Raises:
+            ValueError: If job_id has incorrect format.
+        """
+        self._parent = initializer.global_config.common_location_path(
+            project=self.project, location=self.location
         )
+
+        self.job_id = job_id
         if not _VALID_NAME_PATTERN.match(self.job_id):
             raise ValueError(
                 f"Generated job ID: {self.job_id} is illegal as a Vertex pipelines job ID. "
@@ -238,21 +707,15 @@ class PipelineJob(
                 f'"{_VALID_NAME_PATTERN.pattern[1:-1]}"'
             )
 
-        if enable_caching is not None:
-            _set_enable_caching_value(pipeline_job["pipelineSpec"], enable_caching)
-
-        pipeline_job_args = {
-            "display_name": display_name,
-            "pipeline_spec": pipeline_job["pipelineSpec"],
-            "labels": labels,
-            "runtime_config": runtime_config,
-            "encryption_spec": initializer.global_config.get_encryption_spec(
-                encryption_spec_key_name=encryption_spec_key_name
-            ),
-        }
-
-        if _VALID_AR_URL.match(template_path):
-            pipeline_job_args["template_uri"] = template_path
+        if pipeline_spec is not None:
+            self._is_tfx = "sdkVersion" in pipeline_spec and str(
+                pipeline_spec["sdkVersion"]
+            ).startswith("tfx")
+            if enable_caching is not None:
+                _set_enable_caching_value(pipeline_spec, enable_caching)
+            if not isinstance(pipeline_spec, struct_pb2.Struct):
+                pipeline_spec = _dict_to_struct(pipeline_spec)
+            pipeline_job_args["pipeline_spec"] = pipeline_spec
 
         self._gca_resource = gca_pipeline_job.PipelineJob(**pipeline_job_args)
 
@@ -327,7 +790,7 @@ class PipelineJob(
             self._gca_resource.network = network
 
         # Prevents logs from being supressed on TFX pipelines
-        if self._gca_resource.pipeline_spec.get("sdkVersion", "").startswith("tfx"):
+        if self._is_tfx:
             _LOGGER.setLevel(logging.INFO)
 
         if experiment:
@@ -346,7 +809,8 @@ class PipelineJob(
             self.__class__, self._gca_resource, "pipeline_job"
         )
 
-        _LOGGER.info("View Pipeline Job:\n%s" % self._dashboard_uri())
+        if _LOGGER.isEnabledFor(logging.INFO):
+            _LOGGER.info("View Pipeline Job:\n%s", self._dashboard_uri())
 
         if experiment:
             self._associate_to_experiment(experiment)
@@ -360,18 +824,28 @@ class PipelineJob(
 
     @property
     def pipeline_spec(self):
+        """The pipeline spec.
+
+        Empty for Artifact Registry templates that the service resolves when
+        the job is submitted.
+        """
         return self._gca_resource.pipeline_spec
 
     @property
     def state(self) -> Optional[gca_pipeline_state.PipelineState]:
         """Current pipeline state."""
-        self._sync_gca_resource()
+        self._sync_gca_resource_cached()
         return self._gca_resource.state
 
     @property
-    def task_details(self) -> List[gca_pipeline_job.PipelineTaskDetail]:
-        self._sync_gca_resource()
-        return list(self._gca_resource.job_detail.task_details)
+    def task_details(self) -> Sequence[gca_pipeline_job.PipelineTaskDetail]:
+        """Details of the pipeline tasks.
+
+        The returned sequence is a view of the current PipelineJob resource and
+        is not updated when the job is synced again.
+        """
+        self._sync_gca_resource_cached()
+        return self._gca_resource.job_detail.task_details
 
     @property
     def has_failed(self) -> bool:
@@ -381,40 +855,54 @@ class PipelineJob(
         """
         return self.state == gca_pipeline_state.PipelineState.PIPELINE_STATE_FAILED
 
+    def _sync_gca_resource_cached(self):
+        """Syncs the GAPIC representation of this PipelineJob unless it was
+        synced less than _SYNC_TTL seconds ago, so that bursts of property
+        accesses share a single GetPipelineJob request."""
+        if time.monotonic() - self._last_sync_time < _SYNC_TTL:
+            return
+        self._sync_gca_resource()
+        self._last_sync_time = time.monotonic()
+
     def _dashboard_uri(self) -> str:
         """Helper method to compose the dashboard uri where pipeline can be
         viewed."""
-        fields = self._parse_resource_name(self.resource_name)
-        url = f"https://console.cloud.google.com/vertex-ai/locations/{fields['location']}/pipelines/runs/{fields['pipeline_job']}?project={fields['project']}"
-        return url
+        if not self._cached_dashboard_uri:
+            fields = self._parse_resource_name(self.resource_name)
+            self._cached_dashboard_uri = f"https://console.cloud.google.com/vertex-ai/locations/{fields['location']}/pipelines/runs/{fields['pipeline_job']}?project={fields['project']}"
+        return self._cached_dashboard_uri
 
     def _block_until_complete(self):
-        """Helper method to block and check on job until complete."""
-        # Used these numbers so failures surface fast
-        wait = 5  # start at five seconds
-        log_wait = 5
-        max_wait = 60 * 5  # 5 minute wait
-        multiplier = 2  # scale wait by 2 every iteration
+        """Helper method to block and check on job until complete.
+
+        Pipeline jobs are not long-running operations, so the job is polled
+        with a jittered exponential backoff that starts short, so that quick
+        pipelines complete promptly, and is capped at _MAX_JOB_WAIT_TIME.
+        """
+        wait = _JOB_WAIT_TIME
+        log_wait = _LOG_WAIT_TIME
 
         previous_time = time.time()
-        while self.state not in _PIPELINE_COMPLETE_STATES:
+        while int(self.state) not in _PIPELINE_COMPLETE_STATES:
             current_time = time.time()
             if current_time - previous_time >= log_wait:
                 _LOGGER.info(
-                    "%s %s current state:\n%s"
-                    % (
-                        self.__class__.__name__,
-                        self._gca_resource.name,
-                        self._gca_resource.state,
-                    )
+                    "%s %s current state:\n%s",
+                    self.__class__.__name__,
+                    self._gca_resource.name,
+                    self._gca_resource.state,
                 )
-                log_wait = min(log_wait * multiplier, max_wait)
+                log_wait = min(log_wait * _LOG_WAIT_TIME_MULTIPLIER, _MAX_LOG_WAIT_TIME)
                 previous_time = current_time
-            time.sleep(wait)
+            time.sleep(
+                wait
+                * random.uniform(1 - _JOB_WAIT_TIME_JITTER, 1 + _JOB_WAIT_TIME_JITTER)
+            )
+            wait = min(wait * _JOB_WAIT_TIME_MULTIPLIER, _MAX_JOB_WAIT_TIME)
 
         # Error is only populated when the job state is
         # JOB_STATE_FAILED or JOB_STATE_CANCELLED.
-        if self._gca_resource.state in _PIPELINE_ERROR_STATES:
+        if int(self._gca_resource.state) in _PIPELINE_ERROR_STATES:
             raise RuntimeError("Job failed with:\n%s" % self._gca_resource.error)
         else:
             _LOGGER.log_action_completed_against_resource("run", "completed", self)
@@ -463,6 +951,7 @@ class PipelineJob(
         becomes a job with state set to `CANCELLED`.
         """
         self.api_client.cancel_pipeline_job(name=self.resource_name)
+        self._last_sync_time = 0.0
 
     @classmethod
     def list(
@@ -521,14 +1010,14 @@ class PipelineJob(
         if not self._gca_resource:
             return False
 
-        return self.state in _PIPELINE_COMPLETE_STATES
+        return int(self.state) in _PIPELINE_COMPLETE_STATES
 
     def _has_failed(self) -> bool:
         """Return True if PipelineJob has Failed."""
         if not self._gca_resource:
             return False
 
-        return self.state in _PIPELINE_ERROR_STATES
+        return int(self.state) in _PIPELINE_ERROR_STATES
 
     def _get_context(self) -> context._Context:
         """Returns the PipelineRun Context for this PipelineJob in the MetadataStore.
@@ -583,25 +1072,33 @@ class PipelineJob(
             Experiment run row representing this PipelineJob.
         """
 
-        system_run_executions = execution.Execution.list(
-            project=node.project,
-            location=node.location,
-            credentials=node.credentials,
-            filter=metadata_utils._make_filter_string(
-                in_context=[node.resource_name],
-                schema_title=metadata_constants.SYSTEM_RUN,
-            ),
-        )
+        # The Execution and Artifact queries are independent so they are issued
+        # concurrently.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            system_run_executions_future = executor.submit(
+                execution.Execution.list,
+                project=node.project,
+                location=node.location,
+                credentials=node.credentials,
+                filter=metadata_utils._make_filter_string(
+                    in_context=[node.resource_name],
+                    schema_title=metadata_constants.SYSTEM_RUN,
+                ),
+            )
 
-        metric_artifacts = artifact.Artifact.list(
-            project=node.project,
-            location=node.location,
-            credentials=node.credentials,
-            filter=metadata_utils._make_filter_string(
-                in_context=[node.resource_name],
-                schema_title=metadata_constants.SYSTEM_METRICS,
-            ),
-        )
+            metric_artifacts_future = executor.submit(
+                artifact.Artifact.list,
+                project=node.project,
+                location=node.location,
+                credentials=node.credentials,
+                filter=metadata_utils._make_filter_string(
+                    in_context=[node.resource_name],
+                    schema_title=metadata_constants.SYSTEM_METRICS,
+                ),
+            )
+
+            system_run_executions = system_run_executions_future.result()
+            metric_artifacts = metric_artifacts_future.result()
 
         row = experiment_resources._ExperimentRow(
             experiment_run_type=node.schema_title, name=node.display_name
@@ -614,11 +1111,11 @@ class PipelineJob(
             }
             row.state = system_run_executions[0].state.name
 
-        for metric_artifact in metric_artifacts:
-            if row.metrics:
-                row.metrics.update(metric_artifact.metadata)
-            else:
-                row.metrics = metric_artifact.metadata
+        row.metrics = {
+            key: value
+            for metric_artifact in metric_artifacts
+            for key, value in metric_artifact.metadata.items()
+        } or None
 
         return row
 
@@ -696,72 +1193,113 @@ class PipelineJob(
             location=location,
             credentials=credentials,
         )
-        cloned._parent = initializer.global_config.common_location_path(
-            project=project, location=location
-        )
 
         ## Get gca_resource from original PipelineJob
-        pipeline_job = json_format.MessageToDict(self._gca_resource._pb)
+        original_pb = self._gca_resource._pb
 
         ## Set pipeline_spec
-        pipeline_spec = pipeline_job["pipelineSpec"]
-        if "deploymentConfig" in pipeline_spec:
-            del pipeline_spec["deploymentConfig"]
+        template_uri = original_pb.template_uri
+        if original_pb.pipeline_spec.fields:
+            # The spec is copied as a Struct rather than round-tripped through
+            # a dict, since it can be large.
+            pipeline_spec = struct_pb2.Struct()
+            pipeline_spec.CopyFrom(original_pb.pipeline_spec)
+        elif not template_uri:
+            raise ValueError(
+                "Cannot clone the PipelineJob since it has neither a pipeline "
+                "spec nor a template URI."
+            )
+        else:
+            # The service resolves the spec of the original job from its
+            # Artifact Registry template, so the clone does the same unless
+            # the spec is needed to generate the job ID or set caching.
+            pipeline_spec = None
+            pipeline_json = None
+            if enable_caching is not None:
+                pipeline_json = _load_pipeline_spec(template_uri, project, credentials)
+            elif not job_id:
+                pipeline_name, pipeline_json = _peek_ar_template(
+                    template_uri, credentials
+                )
+                if pipeline_name:
+                    job_id = _generate_job_id(pipeline_name, prefix="cloned-")
+            if pipeline_json is not None:
+                pipeline_spec = _dict_to_struct(
+                    pipeline_json.get("pipelineSpec") or pipeline_json
+                )
 
-        ## Set caching
-        if enable_caching is not None:
-            _set_enable_caching_value(pipeline_spec, enable_caching)
+        if pipeline_spec is not None and "deploymentConfig" in pipeline_spec:
+            del pipeline_spec["deploymentConfig"]
 
         ## Set job_id
-        pipeline_name = pipeline_spec["pipelineInfo"]["name"]
-        cloned.job_id = job_id or "cloned-{pipeline_name}-{timestamp}".format(
-            pipeline_name=re.sub("[^-0-9a-z]+", "-", pipeline_name.lower())
-            .lstrip("-")
-            .rstrip("-"),
-            timestamp=_get_current_time().strftime("%Y%m%d%H%M%S"),
-        )
-        if not _VALID_NAME_PATTERN.match(cloned.job_id):
-            raise ValueError(
-                f"Generated job ID: {cloned.job_id} is illegal as a Vertex pipelines job ID. "
-                "Expecting an ID following the regex pattern "
-                f'"{_VALID_NAME_PATTERN.pattern[1:-1]}"'
-            )
+        if not job_id:
+            pipeline_name = pipeline_spec["pipelineInfo"]["name"]
+            job_id = _generate_job_id(pipeline_name, prefix="cloned-")
 
         ## Set display_name, labels and encryption_spec
         if display_name:
             utils.validate_display_name(display_name)
-        elif not display_name and "displayName" in pipeline_job:
-            display_name = pipeline_job["displayName"]
+        elif not display_name and original_pb.display_name:
+            display_name = original_pb.display_name
 
         if labels:
             utils.validate_labels(labels)
-        elif not labels and "labels" in pipeline_job:
-            labels = pipeline_job["labels"]
+        elif not labels and original_pb.labels:
+            labels = dict(original_pb.labels)
 
-        if encryption_spec_key_name or "encryptionSpec" not in pipeline_job:
+        if encryption_spec_key_name or not original_pb.HasField("encryption_spec"):
             encryption_spec = initializer.global_config.get_encryption_spec(
                 encryption_spec_key_name=encryption_spec_key_name
             )
         else:
-            encryption_spec = pipeline_job["encryptionSpec"]
+            encryption_spec = original_pb.encryption_spec
 
         ## Set runtime_config
-        builder = pipeline_utils.PipelineRuntimeConfigBuilder.from_job_spec_json(
-            pipeline_job
-        )
-        builder.update_pipeline_root(pipeline_root)
-        builder.update_runtime_parameters(parameter_values)
-        runtime_config_dict = builder.build()
-        runtime_config = gca_pipeline_job.PipelineJob.RuntimeConfig()._pb
-        json_format.ParseDict(runtime_config_dict, runtime_config)
+        original_runtime_config = json_format.MessageToDict(original_pb.runtime_config)
+        if pipeline_spec is None:
+            runtime_config = _build_template_runtime_config(
+                pipeline_root or original_runtime_config.get("gcsOutputDirectory"),
+                {
+                    **original_runtime_config.get("parameterValues", {}),
+                    **(parameter_values or {}),
+                },
+            )
+        else:
+            # Only the parts of the spec read by the builder are converted to
+            # dicts.
+            root = pipeline_spec["root"]
+            runtime_config = _build_runtime_config_from_job_spec(
+                {
+                    "pipelineSpec": {
+                        "root": {
+                            "inputDefinitions": json_format.MessageToDict(
+                                root["inputDefinitions"]
+                            )
+                        }
+                        if "inputDefinitions" in root
+                        else {},
+                        "schemaVersion": pipeline_spec["schemaVersion"],
+                    },
+                    "runtimeConfig": original_runtime_config,
+                },
+                pipeline_root,
+                parameter_values,
+            )
+
+        pipeline_job_args = {}
+        if template_uri:
+            pipeline_job_args["template_uri"] = template_uri
 
         ## Create gca_resource for cloned PipelineJob
-        cloned._gca_resource = gca_pipeline_job.PipelineJob(
-            display_name=display_name,
+        cloned._finalize_pipeline_job(
+            job_id=job_id,
             pipeline_spec=pipeline_spec,
+            enable_caching=enable_caching,
+            display_name=display_name,
             labels=labels,
             runtime_config=runtime_config,
             encryption_spec=encryption_spec,
+            **pipeline_job_args,
         )
 
         return cloned
@@ -15,14 +15,20 @@
 # limitations under the License.
 #
 
+import functools
+import http.client
+import json
+import logging
 import re
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Union
 from urllib import request
 
 from google.auth import credentials as auth_credentials
 from google.auth import transport
 from google.cloud import storage
 
+_logger = logging.getLogger(__name__)
+
 # Pattern for an Artifact Registry URL.
 _VALID_AR_URL = re.compile(r"^https:\/\/([\w-]+)-kfp\.pkg\.dev\/.*")
 
@@ -72,16 +78,9 @@ def _load_yaml_from_gs_uri(
     Returns:
       A Dict object representing the YAML document.
     """
-    try:
-        import yaml
-    except ImportError:
-        raise ImportError(
-            "pyyaml is not installed and is required to parse PipelineJob or PipelineSpec files. "
-            'Please install the SDK using "pip install google-cloud-aiplatform[pipelines]"'
-        )
     storage_client = storage.Client(project=project, credentials=credentials)
     blob = storage.Blob.from_string(uri, storage_client)
-    return yaml.safe_load(blob.download_as_bytes())
+    return _load_yaml_or_json(blob.download_as_bytes())
 
 
 def _load_yaml_from_local_file(file_path: str) -> Dict[str, Any]:
@@ -94,15 +93,8 @@ def _load_yaml_from_local_file(file_path: str) -> Dict[str, Any]:
     Returns:
       A Dict object representing the YAML document.
     """
-    try:
-        import yaml
-    except ImportError:
-        raise ImportError(
-            "pyyaml is not installed and is required to parse PipelineJob or PipelineSpec files. "
-            'Please install the SDK using "pip install google-cloud-aiplatform[pipelines]"'
-        )
     with open(file_path) as f:
-        return yaml.safe_load(f)
+        return _load_yaml_or_json(f.read())
 
 
 def _load_yaml_from_ar_uri(
@@ -120,6 +112,69 @@ def _load_yaml_from_ar_uri(
     Returns:
       A Dict object representing the YAML document.
     """
+    response = _open_ar_uri(uri, credentials)
+
+    return _load_yaml_or_json(response.read().decode("utf-8"))
+
+
+def _open_ar_uri(
+    uri: str,
+    credentials: Optional[auth_credentials.Credentials] = None,
+) -> http.client.HTTPResponse:
+    """Opens a document referenced by a Artifact Registry URI.
+
+    Args:
+      uri (str):
+          Required. Artifact Registry URI for the document.
+      credentials (auth_credentials.Credentials):
+          Optional. Credentials to use with Artifact Registry.
+
+    Returns:
+      The HTTP response to read the document from.
+    """
+    req = request.Request(uri)
+
+    if credentials:
+        if not credentials.valid:
+            credentials.refresh(transport.requests.Request())
+        if credentials.token:
+            req.add_header("Authorization", "Bearer " + credentials.token)
+    return request.urlopen(req)
+
+
+def _load_yaml_or_json(data: Union[str, bytes]) -> Dict[str, Any]:
+    """Parses a YAML or JSON document.
+
+    Documents that look like JSON objects, which is what the KFP compiler
+    emits, are parsed with the json module since it is much faster than a YAML
+    parser. Anything else, including JSON-looking documents that fail to parse
+    as JSON, is parsed as YAML, which is a superset of JSON.
+
+    Args:
+      data (Union[str, bytes]):
+          Required. The content of the YAML or JSON document.
+
+    Returns:
+      A Dict object representing the document.
+    """
+    if data.lstrip()[:1] in ("{", b"{"):
+        try:
+            return json.loads(data)
+        except ValueError:
+            pass
+
+    return _get_yaml_module().load(data, Loader=_get_yaml_safe_loader())
+
+
+def _get_yaml_module():
+    """Imports the yaml module.
+
+    Returns:
+      The yaml module.
+
+    Raises:
+      ImportError: If pyyaml is not installed.
+    """
     try:
         import yaml
     except ImportError:
@@ -127,13 +182,27 @@ def _load_yaml_from_ar_uri(
             "pyyaml is not installed and is required to parse PipelineJob or PipelineSpec files. "
             'Please install the SDK using "pip install google-cloud-aiplatform[pipelines]"'
         )
-    req = request.Request(uri)
+    return yaml
 
-    if credentials:
-        if not credentials.valid:
-            credentials.refresh(transport.requests.Request())
-        if credentials.token:
-            req.add_header("Authorization", "Bearer " + credentials.token)
-    response = request.urlopen(req)
 
-    return yaml.safe_load(response.read().decode("utf-8"))
+@functools.lru_cache(maxsize=None)
+def _get_yaml_safe_loader():
+    """Returns the fastest available safe YAML loader.
+
+    The libyaml based CSafeLoader is an order of magnitude faster than the pure
+    Python SafeLoader. A warning is logged once if libyaml is unavailable.
+
+    Returns:
+      The yaml.CSafeLoader class if pyyaml was built with libyaml, otherwise
+      yaml.SafeLoader.
+    """
+    yaml = _get_yaml_module()
+    try:
+        return yaml.CSafeLoader
+    except AttributeError:
+        _logger.warning(
+            "pyyaml was built without libyaml, falling back to the slower pure "
+            "Python YAML loader. Install libyaml and reinstall pyyaml for faster "
+            "parsing of PipelineJob or PipelineSpec files."
+        )
+        return yaml.SafeLoader
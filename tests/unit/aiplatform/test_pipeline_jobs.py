@@ -15,6 +15,7 @@
 # limitations under the License.
 #
 
+import io
 import yaml
 import pytest
 import json
@@ -51,6 +52,7 @@ _TEST_CREDENTIALS = auth_credentials.AnonymousCredentials()
 _TEST_SERVICE_ACCOUNT = "abcde@my-project.iam.gserviceaccount.com"
 
 _TEST_TEMPLATE_PATH = f"gs://{_TEST_GCS_BUCKET_NAME}/job_spec.json"
+_TEST_TEMPLATE_GENERATION = 1234
 _TEST_AR_TEMPLATE_PATH = "https://us-central1-kfp.pkg.dev/proj/repo/pack/latest"
 _TEST_PARENT = f"projects/{_TEST_PROJECT}/locations/{_TEST_LOCATION}"
 _TEST_NETWORK = f"projects/{_TEST_PROJECT}/global/networks/{_TEST_PIPELINE_JOB_ID}"
@@ -268,6 +270,23 @@ def mock_pipeline_service_get_with_fail():
         yield mock_get_pipeline_job
 
 
+@pytest.fixture
+def mock_pipeline_service_get_with_long_run():
+    with mock.patch.object(
+        pipeline_service_client.PipelineServiceClient, "get_pipeline_job"
+    ) as mock_get_pipeline_job:
+        mock_get_pipeline_job.side_effect = [
+            make_pipeline_job(gca_pipeline_state.PipelineState.PIPELINE_STATE_RUNNING)
+            for _ in range(8)
+        ] + [
+            make_pipeline_job(
+                gca_pipeline_state.PipelineState.PIPELINE_STATE_SUCCEEDED
+            ),
+        ]
+
+        yield mock_get_pipeline_job
+
+
 @pytest.fixture
 def mock_pipeline_service_cancel():
     with mock.patch.object(
@@ -288,7 +307,23 @@ def mock_pipeline_service_list():
 def mock_load_yaml_and_json(job_spec):
     with patch.object(storage.Blob, "download_as_bytes") as mock_load_yaml_and_json:
         mock_load_yaml_and_json.return_value = job_spec.encode()
-        yield mock_load_yaml_and_json
+        with patch.object(storage.Blob, "reload"):
+            yield mock_load_yaml_and_json
+
+
+@pytest.fixture
+def mock_load_yaml_and_json_with_generation(job_spec):
+    pipeline_jobs._PIPELINE_SPEC_CACHE.clear()
+
+    def reload_blob(blob, *args, **kwargs):
+        blob._properties["generation"] = _TEST_TEMPLATE_GENERATION
+
+    with patch.object(storage.Blob, "download_as_bytes") as mock_load_yaml_and_json:
+        mock_load_yaml_and_json.return_value = job_spec.encode()
+        with patch.object(storage.Blob, "reload", autospec=True) as mock_reload:
+            mock_reload.side_effect = reload_blob
+            yield mock_load_yaml_and_json
+    pipeline_jobs._PIPELINE_SPEC_CACHE.clear()
 
 
 @pytest.fixture
@@ -1290,3 +1325,450 @@ class TestPipelineJob:
         assert cloned._gca_resource == make_pipeline_job(
             gca_pipeline_state.PipelineState.PIPELINE_STATE_SUCCEEDED
         )
+
+    @pytest.mark.parametrize(
+        "job_spec",
+        [_TEST_PIPELINE_SPEC_JSON, _TEST_PIPELINE_SPEC_YAML, _TEST_PIPELINE_JOB],
+    )
+    def test_pipeline_job_reuses_cached_gcs_template(
+        self, mock_load_yaml_and_json_with_generation
+    ):
+        with patch.object(storage, "Client", wraps=storage.Client) as mock_client:
+            jobs = [
+                pipeline_jobs.PipelineJob(
+                    display_name=_TEST_PIPELINE_JOB_DISPLAY_NAME,
+                    template_path=_TEST_TEMPLATE_PATH,
+                    job_id=_TEST_PIPELINE_JOB_ID,
+                    pipeline_root=_TEST_GCS_BUCKET_NAME,
+                )
+                for _ in range(2)
+            ]
+
+        # The blob reloaded for the generation is reused for the download.
+        assert mock_client.call_count == 2
+        mock_load_yaml_and_json_with_generation.assert_called_once_with(
+            if_generation_match=_TEST_TEMPLATE_GENERATION
+        )
+        assert jobs[0].pipeline_spec == jobs[1].pipeline_spec
+
+    @pytest.mark.parametrize(
+        "job_spec",
+        [_TEST_PIPELINE_SPEC_JSON, _TEST_PIPELINE_SPEC_YAML],
+    )
+    def test_pipeline_job_reloads_modified_local_template(self, job_spec, tmp_path):
+        template_path = str(tmp_path / "pipeline.yaml")
+        with open(template_path, "w") as f:
+            f.write(job_spec)
+
+        pipeline_jobs.PipelineJob(
+            display_name=_TEST_PIPELINE_JOB_DISPLAY_NAME,
+            template_path=template_path,
+            pipeline_root=_TEST_GCS_BUCKET_NAME,
+        )
+
+        modified_job_spec = job_spec.replace("my-pipeline", "my-modified-pipeline")
+        with open(template_path, "w") as f:
+            f.write(modified_job_spec)
+
+        job = pipeline_jobs.PipelineJob(
+            display_name=_TEST_PIPELINE_JOB_DISPLAY_NAME,
+            template_path=template_path,
+            pipeline_root=_TEST_GCS_BUCKET_NAME,
+        )
+
+        assert job.job_id.startswith("my-modified-pipeline-")
+
+    @pytest.mark.parametrize(
+        "runtime_config_dict",
+        [
+            {
+                "gcsOutputDirectory": _TEST_GCS_BUCKET_NAME,
+                "parameterValues": _TEST_PIPELINE_PARAMETER_VALUES,
+            },
+            {
+                "gcsOutputDirectory": _TEST_GCS_BUCKET_NAME,
+                "parameterValues": {
+                    "bool_param": True,
+                    "int_param": 42,
+                    "list_param": [1, "a", [False, None], {"b": 2.5}],
+                    "dict_param": {"c": {"d": ["e"]}, "f": None},
+                },
+            },
+            {
+                "gcsOutputDirectory": _TEST_GCS_BUCKET_NAME,
+                "parameters": {
+                    "string_param": {"stringValue": "hello"},
+                    "int_param": {"intValue": "42"},
+                    "double_param": {"doubleValue": 12.34},
+                },
+            },
+        ],
+    )
+    def test_build_runtime_config(self, runtime_config_dict):
+        expected_runtime_config = gca_pipeline_job.PipelineJob.RuntimeConfig()._pb
+        json_format.ParseDict(runtime_config_dict, expected_runtime_config)
+
+        runtime_config = pipeline_jobs._build_runtime_config(runtime_config_dict)
+
+        assert runtime_config._pb == expected_runtime_config
+
+    @pytest.mark.parametrize(
+        "parameter_values",
+        [
+            {"list_param": ["a"], "set_param": {"b"}},
+            {"struct_param": {1: "a"}},
+            {"list_param": [1, {2: 3}]},
+        ],
+    )
+    def test_build_runtime_config_with_invalid_parameter_value(self, parameter_values):
+        with pytest.raises(json_format.ParseError):
+            pipeline_jobs._build_runtime_config(
+                {
+                    "gcsOutputDirectory": _TEST_GCS_BUCKET_NAME,
+                    "parameterValues": parameter_values,
+                }
+            )
+
+    @pytest.mark.parametrize(
+        "pipeline_name, prefix, expected_job_id",
+        [
+            ("my-pipeline", "", "my-pipeline-20220101000000"),
+            ("--My_Pipeline 1--", "", "my-pipeline-1-20220101000000"),
+            ("my-pipeline", "cloned-", "cloned-my-pipeline-20220101000000"),
+        ],
+    )
+    def test_generate_job_id(self, pipeline_name, prefix, expected_job_id):
+        with patch.object(pipeline_jobs, "_get_current_time") as mock_current_time:
+            mock_current_time.return_value = datetime(2022, 1, 1).timetuple()
+            job_id = pipeline_jobs._generate_job_id(pipeline_name, prefix=prefix)
+
+        assert job_id == expected_job_id
+
+    @pytest.mark.parametrize("enable_caching", [True, False])
+    def test_set_enable_caching_value(self, enable_caching):
+        pipeline_spec = {
+            "root": {"dag": {"tasks": {"task-a": {}, "task-b": {}}}},
+            "components": {
+                "comp-a": {"dag": {"tasks": {"task-c": {}}}},
+                "comp-b": {"executorLabel": "exec-b"},
+            },
+        }
+
+        pipeline_jobs._set_enable_caching_value(pipeline_spec, enable_caching)
+
+        expected_caching_options = {"enableCache": enable_caching}
+        for task in ("task-a", "task-b"):
+            assert (
+                pipeline_spec["root"]["dag"]["tasks"][task]["cachingOptions"]
+                == expected_caching_options
+            )
+        assert (
+            pipeline_spec["components"]["comp-a"]["dag"]["tasks"]["task-c"][
+                "cachingOptions"
+            ]
+            == expected_caching_options
+        )
+        assert pipeline_spec["components"]["comp-b"] == {"executorLabel": "exec-b"}
+
+    @pytest.mark.usefixtures("mock_pipeline_service_get_with_long_run")
+    def test_block_until_complete_backs_off(self):
+        job = pipeline_jobs.PipelineJob.get(resource_name=_TEST_PIPELINE_JOB_ID)
+
+        with patch.object(pipeline_jobs.time, "sleep") as mock_sleep, patch.object(
+            pipeline_jobs.random, "uniform", return_value=1
+        ), patch.object(pipeline_jobs, "_SYNC_TTL", 0):
+            job._block_until_complete()
+
+        assert [call.args[0] for call in mock_sleep.call_args_list] == [
+            0.5,
+            0.75,
+            1.125,
+            1.6875,
+            2.53125,
+            3.796875,
+            5,
+        ]
+
+    def test_state_and_task_details_share_sync(self, mock_pipeline_service_get):
+        job = pipeline_jobs.PipelineJob.get(resource_name=_TEST_PIPELINE_JOB_ID)
+
+        assert job.state == gca_pipeline_state.PipelineState.PIPELINE_STATE_SUCCEEDED
+        assert job.task_details == []
+
+        assert mock_pipeline_service_get.call_count == 2
+
+    def test_clone_pipeline_job_removes_deployment_config(self):
+        pipeline_spec = json.loads(_TEST_PIPELINE_SPEC_JSON)
+        with mock.patch.object(
+            pipeline_service_client.PipelineServiceClient, "get_pipeline_job"
+        ) as mock_get_pipeline_job:
+            mock_get_pipeline_job.return_value = gca_pipeline_job.PipelineJob(
+                name=_TEST_PIPELINE_JOB_NAME,
+                display_name=_TEST_PIPELINE_JOB_DISPLAY_NAME,
+                labels={"key": "value"},
+                pipeline_spec={**pipeline_spec, "deploymentConfig": {"executors": {}}},
+                runtime_config={"gcs_output_directory": _TEST_GCS_BUCKET_NAME},
+                state=gca_pipeline_state.PipelineState.PIPELINE_STATE_SUCCEEDED,
+            )
+            job = pipeline_jobs.PipelineJob.get(resource_name=_TEST_PIPELINE_JOB_ID)
+
+        cloned = job.clone(job_id=f"cloned-{_TEST_PIPELINE_JOB_ID}")
+
+        assert cloned._gca_resource == gca_pipeline_job.PipelineJob(
+            display_name=_TEST_PIPELINE_JOB_DISPLAY_NAME,
+            labels={"key": "value"},
+            pipeline_spec=pipeline_spec,
+            runtime_config={"gcs_output_directory": _TEST_GCS_BUCKET_NAME},
+        )
+
+    def test_dashboard_uri_is_cached(self, mock_pipeline_service_get):
+        job = pipeline_jobs.PipelineJob.get(resource_name=_TEST_PIPELINE_JOB_ID)
+
+        with patch.object(
+            job, "_parse_resource_name", wraps=job._parse_resource_name
+        ) as mock_parse_resource_name:
+            dashboard_uris = [job._dashboard_uri() for _ in range(2)]
+
+        assert (
+            dashboard_uris
+            == [
+                f"https://console.cloud.google.com/vertex-ai/locations/{_TEST_LOCATION}"
+                f"/pipelines/runs/{_TEST_PIPELINE_JOB_ID}?project={_TEST_PROJECT}"
+            ]
+            * 2
+        )
+        mock_parse_resource_name.assert_called_once()
+
+    def test_pipeline_job_defers_artifact_registry_template(
+        self, mock_pipeline_service_create
+    ):
+        with patch.object(request, "urlopen") as mock_urlopen:
+            job = pipeline_jobs.PipelineJob(
+                display_name=_TEST_PIPELINE_JOB_DISPLAY_NAME,
+                template_path=_TEST_AR_TEMPLATE_PATH,
+                job_id=_TEST_PIPELINE_JOB_ID,
+                pipeline_root=_TEST_GCS_BUCKET_NAME,
+                parameter_values=_TEST_PIPELINE_PARAMETER_VALUES,
+            )
+            job.submit()
+
+        mock_urlopen.assert_not_called()
+
+        expected_runtime_config_dict = {
+            "gcsOutputDirectory": _TEST_GCS_BUCKET_NAME,
+            "parameterValues": _TEST_PIPELINE_PARAMETER_VALUES,
+        }
+        runtime_config = gca_pipeline_job.PipelineJob.RuntimeConfig()._pb
+        json_format.ParseDict(expected_runtime_config_dict, runtime_config)
+
+        expected_gapic_pipeline_job = gca_pipeline_job.PipelineJob(
+            display_name=_TEST_PIPELINE_JOB_DISPLAY_NAME,
+            runtime_config=runtime_config,
+            template_uri=_TEST_AR_TEMPLATE_PATH,
+        )
+
+        mock_pipeline_service_create.assert_called_once_with(
+            parent=_TEST_PARENT,
+            pipeline_job=expected_gapic_pipeline_job,
+            pipeline_job_id=_TEST_PIPELINE_JOB_ID,
+            timeout=None,
+        )
+
+    def test_clone_deferred_artifact_registry_pipeline_job(
+        self, mock_pipeline_service_create
+    ):
+        with patch.object(request, "urlopen") as mock_urlopen:
+            job = pipeline_jobs.PipelineJob(
+                display_name=_TEST_PIPELINE_JOB_DISPLAY_NAME,
+                template_path=_TEST_AR_TEMPLATE_PATH,
+                job_id=_TEST_PIPELINE_JOB_ID,
+                pipeline_root=_TEST_GCS_BUCKET_NAME,
+                parameter_values=_TEST_PIPELINE_PARAMETER_VALUES,
+            )
+            cloned = job.clone(
+                job_id=f"cloned-{_TEST_PIPELINE_JOB_ID}",
+                parameter_values={"string_param": "hello cloned"},
+            )
+            cloned.submit()
+
+        mock_urlopen.assert_not_called()
+
+        expected_runtime_config_dict = {
+            "gcsOutputDirectory": _TEST_GCS_BUCKET_NAME,
+            "parameterValues": {
+                **_TEST_PIPELINE_PARAMETER_VALUES,
+                "string_param": "hello cloned",
+            },
+        }
+        runtime_config = gca_pipeline_job.PipelineJob.RuntimeConfig()._pb
+        json_format.ParseDict(expected_runtime_config_dict, runtime_config)
+
+        expected_gapic_pipeline_job = gca_pipeline_job.PipelineJob(
+            display_name=_TEST_PIPELINE_JOB_DISPLAY_NAME,
+            runtime_config=runtime_config,
+            template_uri=_TEST_AR_TEMPLATE_PATH,
+        )
+
+        mock_pipeline_service_create.assert_called_once_with(
+            parent=_TEST_PARENT,
+            pipeline_job=expected_gapic_pipeline_job,
+            pipeline_job_id=f"cloned-{_TEST_PIPELINE_JOB_ID}",
+            timeout=None,
+        )
+
+    @pytest.mark.parametrize("enable_caching", [None, True])
+    def test_clone_deferred_artifact_registry_pipeline_job_loads_template(
+        self, enable_caching
+    ):
+        job = pipeline_jobs.PipelineJob(
+            display_name=_TEST_PIPELINE_JOB_DISPLAY_NAME,
+            template_path=_TEST_AR_TEMPLATE_PATH,
+            job_id=_TEST_PIPELINE_JOB_ID,
+            pipeline_root=_TEST_GCS_BUCKET_NAME,
+        )
+
+        with patch.object(request, "urlopen") as mock_urlopen:
+            mock_urlopen.return_value.read.return_value = (
+                _TEST_PIPELINE_SPEC_JSON.encode()
+            )
+            cloned = job.clone(enable_caching=enable_caching)
+
+        assert cloned.job_id.startswith("cloned-my-pipeline-")
+        assert cloned._gca_resource.template_uri == _TEST_AR_TEMPLATE_PATH
+        assert bool(cloned.pipeline_spec) is (enable_caching is not None)
+
+    def test_clone_pipeline_job_without_spec_or_template_raises(self):
+        job = pipeline_jobs.PipelineJob._empty_constructor()
+        job._gca_resource = gca_pipeline_job.PipelineJob(
+            display_name=_TEST_PIPELINE_JOB_DISPLAY_NAME
+        )
+
+        with pytest.raises(ValueError, match="neither a pipeline spec"):
+            job.clone()
+
+    @pytest.mark.parametrize(
+        "path, expected",
+        [
+            (_TEST_AR_TEMPLATE_PATH, True),
+            (_TEST_TEMPLATE_PATH, False),
+            ("pipeline.json", False),
+            ("https://us-docker.pkg.dev/v2/proj/repo/img/tags/list", False),
+        ],
+    )
+    def test_is_ar_url(self, path, expected):
+        assert pipeline_jobs._is_ar_url(path) is expected
+
+    @pytest.mark.parametrize(
+        "template_prefix, expected_pipeline_name",
+        [
+            (_TEST_PIPELINE_SPEC_JSON.encode(), "my-pipeline"),
+            (_TEST_PIPELINE_SPEC_YAML.encode(), "my-pipeline"),
+            (_TEST_PIPELINE_JOB.encode(), "my-pipeline"),
+            (b'pipelineInfo:\n  name: "my-pipeline"\n', "my-pipeline"),
+            (
+                b"# PIPELINE DEFINITION\n# Name: my-pipeline\n# Inputs:\n",
+                "my-pipeline",
+            ),
+            (b"pipelineInfo:\n  name: my-pipe", None),
+            (b'{"pipelineInfo": {"name": "my-pipe', None),
+            (b'{"pipelineInfo": {"name": "my-pipe\\x"}}', None),
+            (b"components: {}\n", None),
+        ],
+    )
+    def test_peek_pipeline_name(self, template_prefix, expected_pipeline_name):
+        assert (
+            pipeline_jobs._peek_pipeline_name(template_prefix) == expected_pipeline_name
+        )
+
+    @pytest.mark.parametrize(
+        "job_spec", [_TEST_PIPELINE_SPEC_JSON, _TEST_PIPELINE_SPEC_YAML]
+    )
+    def test_pipeline_job_peeks_artifact_registry_template_name(self, job_spec):
+        with patch.object(request, "urlopen") as mock_urlopen:
+            mock_urlopen.return_value.read.return_value = job_spec.encode()[
+                : pipeline_jobs._PIPELINE_NAME_PEEK_SIZE
+            ]
+            job = pipeline_jobs.PipelineJob(
+                display_name=_TEST_PIPELINE_JOB_DISPLAY_NAME,
+                template_path=_TEST_AR_TEMPLATE_PATH,
+                pipeline_root=_TEST_GCS_BUCKET_NAME,
+            )
+
+        mock_urlopen.return_value.read.assert_called_once_with(
+            pipeline_jobs._PIPELINE_NAME_PEEK_SIZE
+        )
+        assert job.job_id.startswith("my-pipeline-")
+        assert job._gca_resource.template_uri == _TEST_AR_TEMPLATE_PATH
+        assert not job._gca_resource.pipeline_spec
+
+    @pytest.mark.parametrize(
+        "dump_template",
+        [
+            lambda spec: json.dumps(spec, sort_keys=True),
+            lambda spec: yaml.safe_dump(spec, sort_keys=True),
+        ],
+    )
+    def test_pipeline_job_reads_artifact_registry_template_once(self, dump_template):
+        # KFP sorts the keys of the spec, so pipelineInfo comes after the
+        # components and is past the peeked prefix of large templates.
+        pipeline_spec = {
+            **json.loads(_TEST_PIPELINE_SPEC_JSON),
+            "components": {
+                f"comp-{i}": {"executorLabel": f"exec-{i}"} for i in range(200)
+            },
+        }
+        template = dump_template(pipeline_spec).encode()
+        assert template.find(b"pipelineInfo") > pipeline_jobs._PIPELINE_NAME_PEEK_SIZE
+
+        with patch.object(request, "urlopen") as mock_urlopen:
+            mock_urlopen.return_value = io.BytesIO(template)
+            job = pipeline_jobs.PipelineJob(
+                display_name=_TEST_PIPELINE_JOB_DISPLAY_NAME,
+                template_path=_TEST_AR_TEMPLATE_PATH,
+                pipeline_root=_TEST_GCS_BUCKET_NAME,
+            )
+
+        mock_urlopen.assert_called_once()
+        assert job.job_id.startswith("my-pipeline-")
+        assert job._gca_resource.template_uri == _TEST_AR_TEMPLATE_PATH
+        assert (
+            json_format.MessageToDict(job._gca_resource._pb.pipeline_spec)
+            == pipeline_spec
+        )
+
+    @pytest.mark.parametrize("enable_caching", [True, False])
+    def test_set_enable_caching_value_on_struct(self, enable_caching):
+        pipeline_spec = {
+            "root": {"dag": {"tasks": {"task-a": {}}}},
+            "components": {
+                "comp-a": {"dag": {"tasks": {"task-b": {}}}},
+                "comp-b": {"executorLabel": "exec-b"},
+            },
+        }
+        pipeline_spec_struct = pipeline_jobs._dict_to_struct(pipeline_spec)
+
+        pipeline_jobs._set_enable_caching_value(pipeline_spec, enable_caching)
+        pipeline_jobs._set_enable_caching_value(pipeline_spec_struct, enable_caching)
+
+        assert json_format.MessageToDict(pipeline_spec_struct) == pipeline_spec
+
+    @pytest.mark.parametrize(
+        "job_spec, is_tfx",
+        [(_TEST_PIPELINE_SPEC_JSON, False), (_TEST_TFX_PIPELINE_SPEC_JSON, True)],
+    )
+    def test_pipeline_job_is_tfx(self, job_spec, is_tfx, mock_load_yaml_and_json):
+        aiplatform.init(
+            project=_TEST_PROJECT,
+            staging_bucket=_TEST_GCS_BUCKET_NAME,
+            location=_TEST_LOCATION,
+            credentials=_TEST_CREDENTIALS,
+        )
+
+        job = pipeline_jobs.PipelineJob(
+            display_name=_TEST_PIPELINE_JOB_DISPLAY_NAME,
+            template_path=_TEST_TEMPLATE_PATH,
+            job_id=_TEST_PIPELINE_JOB_ID,
+        )
+
+        assert job._is_tfx is is_tfx
+        assert job.clone()._is_tfx is is_tfx
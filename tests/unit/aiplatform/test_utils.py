@@ -589,6 +589,14 @@ class TestYamlUtils:
         expected = {"key": "val", "list": ["1", 2, 3.0]}
         assert actual == expected
 
+    def test_load_yaml_from_local_file__with_yaml_flow_mapping(self, tmp_path):
+        yaml_file_path = os.path.join(tmp_path, "test.yaml")
+        with open(yaml_file_path, "w") as f:
+            f.write("{key: val, list: ['1', 2, 3.0]}")
+        actual = yaml_utils.load_yaml(yaml_file_path)
+        expected = {"key": "val", "list": ["1", 2, 3.0]}
+        assert actual == expected
+
     def test_load_yaml_from_ar_uri(self, mock_request_urlopen):
         actual = yaml_utils.load_yaml(mock_request_urlopen)
         expected = {"key": "val", "list": ["1", 2, 3.0]}
@@ -597,3 +605,8 @@ class TestYamlUtils:
     def test_load_yaml_from_invalid_uri(self):
         with pytest.raises(FileNotFoundError):
             yaml_utils.load_yaml("https://us-docker.pkg.dev/v2/proj/repo/img/tags/list")
+
+    def test_get_yaml_safe_loader(self):
+        yaml_utils._get_yaml_safe_loader.cache_clear()
+        expected = yaml.CSafeLoader if yaml.__with_libyaml__ else yaml.SafeLoader
+        assert yaml_utils._get_yaml_safe_loader() is expected